@@ -3,10 +3,10 @@
 import os
 import os.path
 import argparse
+import asyncio
 import threading
 import http.server
 import socket
-import select
 import sys
 import urllib.parse
 import json
@@ -18,8 +18,12 @@ import getpass
 import shutil
 import signal
 import stat
+import concurrent.futures
+import queue
+import ctypes
+import logging
 
-from typing import cast, Any, Dict, Optional, Sequence, Tuple, Type, Union
+from typing import cast, Any, Dict, Optional, Sequence, Tuple, Type, TypeVar, Union
 
 from atomicwrites import atomic_write
 
@@ -27,11 +31,25 @@ from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 
 import daemon # type: ignore
 from requests_oauthlib import OAuth2Session # type: ignore
 
+SESSION_VERSION = 2
+
+_T = TypeVar('_T')
+
+# Applications decide where log output goes; see scripts/oauth2-clientd
+_LOG = logging.getLogger(__name__)
+_LOG.addHandler(logging.NullHandler())
+
+# These only describe configuration and are safe to share between threads.
+_BACKEND = default_backend()
+_OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                     algorithm=hashes.SHA256(), label=None)
+
 class NoTokenError(RuntimeError):
     """The token is not available"""
 
@@ -47,99 +65,82 @@ except ImportError:
 
 
 class _RedirectURIHandler(http.server.BaseHTTPRequestHandler):
+    # Narrows the type for checkers without a runtime cast() per request
+    server: '_ThreadingHTTPServerWithContext'
+
     def log_request(self, code: Union[int, str] = '-',
                     size: Union[int, str] = '-') -> None:
-        server = cast(_ThreadingHTTPServerWithContext, self.server)
-        if server.context.debug:
+        if self.server.context.debug:
             super().log_request(code, size)
 
-    def do_HEAD(self) -> None:
-        # pylint: disable=invalid-name
+    _ALREADY_PROVIDED = (b'The authorization redirect has already been provided '
+                         b'and this server will shut down shortly.')
+    _REDIRECT_COMPLETED = b'Authorization redirect completed. You may close this window.'
+    _INVALID_REQUEST = b'The requested URI does not represent an authorization redirect.'
+
+    def _send_headers(self, length: Optional[int] = None) -> None:
+        # The headers are buffered and go out in a single write with end_headers()
         self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Type', 'text/html')
+        if length is not None:
+            self.send_header('Content-Length', str(length))
         self.end_headers()
 
-    def _write_already_provided(self) -> None:
-        self.wfile.write(b'The authorization redirect has already been provided ' +
-                         b'and this server will shut down shortly.')
-
-    def _write_redirect_completed(self) -> None:
-        self.wfile.write(b'Authorization redirect completed. You may '
-                         b'close this window.')
+    @staticmethod
+    def _page(message: bytes) -> bytes:
+        return (b'<html><head><title>Authorizaton result</title></head>'
+                b'<body><p>' + message + b'</p></body></html>')
 
-    def _write_invalid_request(self) -> None:
-        self.wfile.write(b'The requested URI does not represent an authorization redirect.')
+    def do_HEAD(self) -> None:
+        # pylint: disable=invalid-name
+        # Which page a GET would return depends on state, so omit the length
+        self._send_headers()
 
     # pylint: disable=invalid-name
     def do_GET(self) -> None:
-        self.do_HEAD()
-        self.wfile.write(b'<html><head><title>Authorizaton result</title></head>')
-        self.wfile.write(b'<body><p>')
-
         path = 'http://localhost' + self.path
-        server = cast(_ThreadingHTTPServerWithContext, self.server)
-        if server.context.validate_authurl(path):
-            with server.context.authurl_lock:
-                if server.context.authurl:
-                    self._write_already_provided()
+        ctx = self.server.context
+        if ctx.validate_authurl(path):
+            with ctx.authurl_lock:
+                if ctx.authurl:
+                    message = self._ALREADY_PROVIDED
                 else:
-                    server.context.authurl = path
-                    self._write_redirect_completed()
+                    ctx.authurl = path
+                    ctx.authurl_ready.set()
+                    message = self._REDIRECT_COMPLETED
         else:
-            self._write_invalid_request()
-        self.wfile.write(b'</p></body></html>')
-
-class _TokenSocketHandler(http.server.BaseHTTPRequestHandler):
-    def log_request(self, code: Union[int, str] = '-',
-                    size: Union[int, str] = '-') -> None:
-        server = cast(_ThreadingHTTPServerWithContext, self.server)
-        if server.context.verbose or server.context.debug:
-            super().log_request(code, size)
+            message = self._INVALID_REQUEST
 
-    # pylint: disable=invalid-name
-    def do_HEAD(self) -> None:
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-
-    # pylint: disable=invalid-name
-    def do_GET(self) -> None:
-        self.do_HEAD()
-        server = cast(_ThreadingHTTPServerWithContext, self.server)
-        with server.context.token_lock:
-            if (not server.context.token or
-                    not 'access_token' in server.context.token):
-                raise NoTokenError("Cannot retreive access token")
-            response = server.context.token['access_token']
-
-        self.wfile.write(bytes(response, 'utf-8'))
+        body = self._page(message)
+        self._send_headers(len(body))
+        self.wfile.write(body)
 
 class _ThreadingHTTPServerWithContext(ThreadingHTTPServer):
+    # Don't drop connections when something scans the listener
+    request_queue_size = 32
+
     def __init__(self, address: Tuple[str, int],
                  handler: Type[http.server.BaseHTTPRequestHandler],
                  context: 'OAuth2ClientManager') -> None:
         super().__init__(address, handler)
         self.context = context
 
-class _UnixSocketThreadingHTTPServer(_ThreadingHTTPServerWithContext):
-    address_family = socket.AF_UNIX
-    def __init__(self, filename: str,
-                 handler: Type[http.server.BaseHTTPRequestHandler],
-                 context: 'OAuth2ClientManager') -> None:
-        super().__init__((filename, 0), handler, context)
-
-    def server_bind(self) -> None:
-        self.socket.bind(self.server_address[0])
+class OAuth2ClientManager:
+    __slots__ = ('_registration', '_is_localhost_redirect', 'client',
+                 'session_file_path', 'public_key', 'saved_session', 'session',
+                 'token', 'authurl', 'authurl_lock', 'authurl_ready',
+                 '_authurl_from_stdin', '_server', '_server_thread',
+                 '_socket_loop', '_socket_thread', '_socket_stop', '_socket_clients',
+                 '_file_thread', '_file_queue', 'debug', 'verbose')
 
-    def get_request(self) -> Tuple[Any, Tuple[str, int]]:
-        req, _ = super().get_request()
-        return req, self.server_address
+    # How long a token socket client may take to send its request
+    _REQUEST_TIMEOUT = 5.0
 
-class OAuth2ClientManager:
     def __init__(self, registration: Dict[str, Sequence[str]],
                  client: Dict[str, str], debug: bool = False,
                  verbose: bool = False) -> None:
         self._registration = registration
+        self._is_localhost_redirect = 'http://localhost' in registration.get('redirect_uri', '')
         self.client = client
         self.session_file_path: Optional[str] = None
         self.public_key: Optional[rsa.RSAPublicKey] = None
@@ -147,51 +148,87 @@ class OAuth2ClientManager:
         self.session: OAuth2Session = None
 
         self.token: Optional[Dict[str, Any]] = None
-        self.token_lock = threading.Lock()
-        self.token_changed = threading.Condition(self.token_lock)
 
         self.authurl: Optional[str] = None
         self.authurl_lock = threading.Lock()
+        self.authurl_ready = threading.Event()
+        self._authurl_from_stdin = False
 
         self._server: Optional[_ThreadingHTTPServerWithContext] = None
         self._server_thread: Optional[threading.Thread] = None
 
+        self._socket_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._socket_thread: Optional[threading.Thread] = None
+        self._socket_stop: Optional[asyncio.Future] = None
+        self._socket_clients: Dict[asyncio.StreamWriter, asyncio.Future] = {}
+
         self._file_thread: Optional[threading.Thread] = None
-        self._file_thread_exit = threading.Event()
+        self._file_queue: Optional['queue.Queue[Optional[str]]'] = None
 
         self.debug: bool = debug
         self.verbose: bool = verbose
 
     @property
     def access_token_expiry(self) -> float:
-        if not self.token:
+        token = self.token
+        if not token:
             raise NoTokenError("No valid token found.")
-        if not 'expires_at' in self.token:
+        if not 'expires_at' in token:
             raise ValueError("Token is missing expiration")
-        with self.token_lock:
-            expiry = self.token['expires_at']
-        return expiry
+        return token['expires_at']
 
-    def _init_saved_session(self) -> None:
-        password_bytes = None
-        while password_bytes is None:
+    @staticmethod
+    def _wait_with_progress(future: 'concurrent.futures.Future[_T]', message: str) -> _T:
+        # The cryptography backend releases the GIL, so we can keep the
+        # user informed while it works.
+        if future.done() or not sys.stderr.isatty():
+            return future.result()
+
+        spinner = '|/-\\'
+        count = 0
+        print(message, end=' ', file=sys.stderr, flush=True)
+        while True:
             try:
-                pw1 = getpass.getpass("Enter password for new private key (min 10 chars): ")
-                if len(pw1) < 10:
-                    print("Password too short.  Must be longer than 10 characters.",
-                          file=sys.stderr)
-                    continue
-                pw2 = getpass.getpass("Repeat: ")
-            except (KeyboardInterrupt, EOFError) as ex:
-                raise NoPrivateKeyError("Cannot create private key without password.") from ex
+                result = future.result(timeout=0.1)
+                break
+            except concurrent.futures.TimeoutError:
+                print(f"\b{spinner[count % len(spinner)]}", end='',
+                      file=sys.stderr, flush=True)
+                count += 1
+            except Exception:
+                print("\bfailed.", file=sys.stderr, flush=True)
+                raise
+        print("\bdone.", file=sys.stderr, flush=True)
+        return result
 
-            if pw1 == pw2:
-                password_bytes = bytes(pw1.encode())
-            else:
-                print("Passwords don't match.  Try again.")
+    def _init_saved_session(self) -> None:
+        # Key generation doesn't depend on the password, so start it as soon
+        # as the user has committed to one and let it run during the prompts.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            keygen: Optional['concurrent.futures.Future[rsa.RSAPrivateKey]'] = None
+            password_bytes = None
+            while password_bytes is None:
+                try:
+                    pw1 = getpass.getpass("Enter password for new private key (min 10 chars): ")
+                    if len(pw1) < 10:
+                        print("Password too short.  Must be longer than 10 characters.",
+                              file=sys.stderr)
+                        continue
+                    if keygen is None:
+                        keygen = pool.submit(rsa.generate_private_key, public_exponent=65537,
+                                             key_size=2048, backend=_BACKEND)
+                    pw2 = getpass.getpass("Repeat: ")
+                except (KeyboardInterrupt, EOFError) as ex:
+                    raise NoPrivateKeyError("Cannot create private key without password.") from ex
+
+                if pw1 == pw2:
+                    password_bytes = pw1.encode('utf-8')
+                else:
+                    print("Passwords don't match.  Try again.")
+
+            assert keygen is not None
+            private_key = self._wait_with_progress(keygen, "Generating private key...")
 
-        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048,
-                                               backend=default_backend())
         self.public_key = private_key.public_key()
 
         private_key_pem = private_key.private_bytes(encoding=serialization.Encoding.PEM,
@@ -209,10 +246,13 @@ class OAuth2ClientManager:
     def from_saved_session(cls, path: str, debug: bool = False,
                            verbose: bool = False) -> 'OAuth2ClientManager':
         with open(path, 'rb') as session_file:
-            saved_session = json.loads(session_file.read())
+            saved_session = json.load(session_file)
+
+        if saved_session.get('version', 1) > SESSION_VERSION:
+            raise ValueError(f"Unsupported session file version {saved_session['version']}")
 
-        private_key_pem_bytes = bytes(saved_session['private_key'], 'utf-8')
-        public_key_pem_bytes = bytes(saved_session['public_key'], 'utf-8')
+        private_key_pem_bytes = saved_session['private_key'].encode('utf-8')
+        public_key_pem_bytes = saved_session['public_key'].encode('utf-8')
 
         private_key = None
         while private_key is None:
@@ -224,93 +264,109 @@ class OAuth2ClientManager:
             if not password:
                 continue
 
-            password_bytes = bytes(password.encode())
-            try:
-                private_key = serialization.load_pem_private_key(private_key_pem_bytes,
-                                                                 password=password_bytes,
-                                                                 backend=default_backend())
-            except ValueError as ex: # Usually bad password
-                print(ex)
-
-        key = private_key.decrypt(cls._b64decode(saved_session['cryptoparams']['key']),
-                                  cls._crypto_padding())
+            password_bytes = password.encode('utf-8')
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+                unlock = pool.submit(serialization.load_pem_private_key,
+                                     private_key_pem_bytes, password=password_bytes,
+                                     backend=_BACKEND)
+                try:
+                    private_key = cls._wait_with_progress(unlock, "Unlocking private key...")
+                except ValueError as ex: # Usually bad password
+                    print(ex)
+
+        key = bytearray(private_key.decrypt(cls._b64decode(saved_session['cryptoparams']['key']),
+                                            _OAEP))
         del private_key
 
-        nonce = cls._b64decode(saved_session['cryptoparams']['nonce'])
-
-        cipher = Cipher(algorithms.AES(key), modes.CTR(nonce), backend=default_backend())
-        decryptor = cipher.decryptor()
-        data = decryptor.update(cls._b64decode(saved_session['data'])) + decryptor.finalize()
-        session = json.loads(cls._b64decode(data))
+        try:
+            data = cls._decrypt(key, saved_session['cryptoparams'],
+                                cls._b64decode(saved_session['data']))
+        finally:
+            cls._scrub(key)
+        # Version 1 session files base64-encoded the JSON before encrypting it
+        if saved_session.get('version', 1) < 2:
+            data = cls._b64decode(data)
+        session = json.loads(data)
 
         obj = cls(session['registration'], session['client'], debug, verbose)
         obj.session_file_path = path
         obj.saved_session = saved_session
         obj.public_key = serialization.load_pem_public_key(public_key_pem_bytes,
-                                                           backend=default_backend())
+                                                           backend=_BACKEND)
 
         obj.token = session['tokendata']
         obj.session = OAuth2Session(session['client'], token=obj.token)
 
         return obj
 
-    @staticmethod
-    def _crypto_padding() -> padding.OAEP:
-        return padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                            algorithm=hashes.SHA256(), label=None)
-
-    @staticmethod
-    def _encode_dict(dict_to_dump) -> bytes:
-        dump = bytes(json.dumps(dict_to_dump), 'utf-8')
-        return base64.urlsafe_b64encode(dump)
-
-    @staticmethod
-    def _decode_dict(json_dict: bytes) -> str:
-        text = base64.urlsafe_b64decode(json_dict)
-        return json.loads(text)
-
     @classmethod
-    def _b64encode(cls, data: Union[bytes, str]) -> bytes:
-        if not isinstance(data, bytes):
-            data = bytes(data, 'utf-8')
+    def _b64encode(cls, data: Union[bytes, bytearray, memoryview, str]) -> bytes:
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.encode('utf-8')
 
         return base64.urlsafe_b64encode(data)
 
     @classmethod
-    def _b64encode_str(cls, data: bytes) -> str:
+    def _b64encode_str(cls, data: Union[bytes, bytearray, memoryview]) -> str:
         return cls._b64encode(data).decode('utf-8')
 
     @classmethod
-    def _b64decode(cls, data: bytes) -> bytes:
-        if not isinstance(data, bytes):
-            data = bytes(data, 'utf-8')
+    def _b64decode(cls, data: Union[bytes, bytearray, memoryview, str]) -> bytes:
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.encode('ascii')
 
         return base64.urlsafe_b64decode(data)
 
     @classmethod
     def _b64decode_str(cls, data: Union[bytes, str]) -> str:
         if not isinstance(data, bytes):
-            data = bytes(data, 'utf-8')
+            data = data.encode('utf-8')
 
         return base64.urlsafe_b64encode(data).decode('utf-8')
 
 
+    @staticmethod
+    def _scrub(secret: bytearray) -> None:
+        """Overwrite a secret held in a mutable buffer once it's no longer needed"""
+        if secret:
+            ctypes.memset((ctypes.c_char * len(secret)).from_buffer(secret), 0, len(secret))
+
+    @classmethod
+    def _decrypt(cls, key: bytearray, params: Dict[str, str], data: bytes) -> bytes:
+        if params['algo'] != 'AES':
+            raise ValueError(f"Unsupported cipher algorithm {params['algo']}")
+
+        nonce = cls._b64decode(params['nonce'])
+        if params['mode'] == 'GCM':
+            return AESGCM(key).decrypt(nonce, data, None)
+
+        # Session files written by older versions
+        if params['mode'] == 'CTR':
+            cipher = Cipher(algorithms.AES(key), modes.CTR(nonce), backend=_BACKEND)
+            decryptor = cipher.decryptor()
+            return decryptor.update(data) + decryptor.finalize()
+
+        raise ValueError(f"Unsupported cipher mode {params['mode']}")
+
     def _encrypt(self, data: bytes) -> Tuple[bytes, Dict[str, str]]:
         if not self.public_key:
             raise RuntimeError("No public key available")
-        key = os.urandom(32)
-        nonce = os.urandom(16)
-
-        params: Dict[str, str] = {
-            'algo' : 'AES',
-            'mode' : 'CTR',
-            'key' : self._b64encode_str(self.public_key.encrypt(key, self._crypto_padding())),
-            'nonce' : self._b64encode_str(nonce),
-        }
-
-        cipher = Cipher(algorithms.AES(key), modes.CTR(nonce), backend=default_backend())
-        encryptor = cipher.encryptor()
-        encrypted_data = encryptor.update(data) + encryptor.finalize()
+        key = bytearray(os.urandom(32))
+        nonce = os.urandom(12)
+
+        try:
+            # RSA encryption only takes bytes, so that temporary copy
+            # can't be scrubbed.
+            params: Dict[str, str] = {
+                'algo' : 'AES',
+                'mode' : 'GCM',
+                'key' : self._b64encode_str(self.public_key.encrypt(bytes(key), _OAEP)),
+                'nonce' : self._b64encode_str(nonce),
+            }
+
+            encrypted_data = AESGCM(key).encrypt(nonce, data, None)
+        finally:
+            self._scrub(key)
 
         return encrypted_data, params
 
@@ -328,16 +384,23 @@ class OAuth2ClientManager:
             'tokendata' : self.token,
         }
 
-        data, params = self._encrypt(self._encode_dict(data_dict))
-        self.saved_session['data'] = self._b64encode_str(data)
-        self.saved_session['cryptoparams'] = params
+        data, params = self._encrypt(json.dumps(data_dict).encode('utf-8'))
 
         if path is None:
             raise RuntimeError("No session file named for write.")
 
-        jsondata = json.dumps(self.saved_session, sort_keys=True, indent=4)
-        del self.saved_session['data']
-        del self.saved_session['cryptoparams']
+        # Build a new dict rather than updating self.saved_session so other
+        # threads never see a half-written session.
+        payload = {
+            **self.saved_session,
+            'version' : SESSION_VERSION,
+            'data' : self._b64encode_str(data),
+            'cryptoparams' : params,
+        }
+        if self.debug:
+            jsondata = json.dumps(payload, sort_keys=True, indent=4)
+        else:
+            jsondata = json.dumps(payload, separators=(',', ':'))
         with atomic_write(path, overwrite=overwrite) as session_file:
             os.fchmod(session_file.fileno(), 0o600)
             print(jsondata, file=session_file)
@@ -353,11 +416,10 @@ class OAuth2ClientManager:
         self._server_thread.start()
 
     def _setup_redirect_listener(self, port) -> None:
+        # Let the server bind an ephemeral port itself; it's available
+        # afterwards via _get_redirect_listener_port().
         if port == -1:
-            sock = socket.socket()
-            sock.bind(('127.0.0.1', 0))
-            port = sock.getsockname()[1]
-            sock.close()
+            port = 0
 
         self._server = _ThreadingHTTPServerWithContext(('127.0.0.1', port), _RedirectURIHandler, self)
 
@@ -380,9 +442,11 @@ class OAuth2ClientManager:
 
     @staticmethod
     def _generate_pkce_context() -> Tuple[str, Dict[str, str]]:
-        verifier = secrets.token_urlsafe(90)
-        digest = hashlib.sha256(verifier.encode()).digest()
-        challenge = base64.urlsafe_b64encode(digest)[:-1].decode('utf-8')
+        # RFC 7636 wants 43-128 characters; 64 random bytes encode to 86.
+        verifier_bytes = base64.urlsafe_b64encode(secrets.token_bytes(64)).rstrip(b'=')
+        digest = hashlib.sha256(verifier_bytes).digest()
+        challenge = base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+        verifier = verifier_bytes.decode('ascii')
 
         pkce_challenge = {
             'code_challenge_method' : 'S256',
@@ -406,31 +470,50 @@ class OAuth2ClientManager:
     @staticmethod
     def validate_authurl(url: str) -> bool:
         """Validate that a url could potentially be an authurl by testing for the 'code' query variable"""
+        # Cheap rejection before parsing anything
+        if 'code=' not in url:
+            return False
         querystring = urllib.parse.urlparse(url).query
         qvars = urllib.parse.parse_qs(querystring)
         return 'code' in qvars
 
-    # This handles racing with the http listener
+    def _read_authurl_from_stdin(self) -> None:
+        while not self.authurl_ready.is_set():
+            url = sys.stdin.readline()
+            # The browser won while we were blocked; this line isn't ours
+            if self.authurl_ready.is_set():
+                return
+            if not url:
+                # Without a redirect listener nothing else can provide the
+                # authurl, so wake the waiter and let it report the failure.
+                if not self._server:
+                    self.authurl_ready.set()
+                return
+            if not self.validate_authurl(url):
+                print("Error: No authcode provided.")
+                self._print_authurl_prompt()
+                continue
+            with self.authurl_lock:
+                if not self.authurl:
+                    self.authurl = url
+                    self._authurl_from_stdin = True
+                    self.authurl_ready.set()
+
+    # This handles racing with the http listener.  The stdin reader runs
+    # in a daemon thread so that a browser redirect wakes us immediately;
+    # a reader still blocked in readline() won't keep the process alive.
     def _wait_for_authurl_on_stdin(self) -> None:
         self._print_authurl_prompt()
-        while True:
-            (readers, _, _) = select.select([sys.stdin], [], [], 0.5)
-            with self.authurl_lock:
-                if not self.authurl and readers:
-                    try:
-                        url = sys.stdin.readline()
-                        if self.validate_authurl(url):
-                            self.authurl = url
-                        else:
-                            print("Error: No authcode provided.")
-                            self._print_authurl_prompt()
-                            continue
-                    except KeyboardInterrupt:
-                        break
-                elif self.authurl:
-                    print("<canceled>\nResponse provided by browser session.")
-                if self.authurl:
-                    break
+        reader = threading.Thread(target=self._read_authurl_from_stdin, daemon=True)
+        reader.start()
+        try:
+            self.authurl_ready.wait()
+        except KeyboardInterrupt:
+            return
+
+        with self.authurl_lock:
+            if self.authurl and not self._authurl_from_stdin:
+                print("<canceled>\nResponse provided by browser session.")
 
 
     @classmethod
@@ -444,7 +527,7 @@ class OAuth2ClientManager:
 
     def _new_authorization(self, port: int = -1) -> None:
         redirect_uri = self._registration['redirect_uri']
-        if 'http://localhost' in redirect_uri:
+        if self._is_localhost_redirect:
             self._setup_redirect_listener(port)
             port = self._get_redirect_listener_port()
 
@@ -488,74 +571,156 @@ class OAuth2ClientManager:
         new_token = self.session.refresh_token(self._registration['token_endpoint'], **self.client)
         self._log("Token refreshed")
 
-        with self.token_changed:
-            self.token = new_token
-            self.token_changed.notify()
+        # Readers take a reference to self.token without locking, so the
+        # new token must be published fully formed in a single store.
+        self.token = new_token
+        if self._file_queue:
+            if not 'access_token' in new_token:
+                raise NoTokenError("Access token changed but is unavailable.")
+            self._file_queue.put_nowait(new_token['access_token'])
 
     def get_access_token(self) -> str:
-        if not self.token or not 'access_token' in self.token:
+        token = self.token
+        if not token or not 'access_token' in token:
             raise NoTokenError("No access token available")
-        with self.token_lock:
-            access_token = self.token['access_token']
-        return access_token
+        return token['access_token']
 
-    def write_access_token(self, filename: str) -> None:
-        if not self.token or not 'access_token' in self.token:
-            raise NoTokenError("No access token available.")
+    @staticmethod
+    def _write_and_rename(access_token: str, filename: str) -> None:
         with atomic_write(filename, overwrite=True) as access_file:
             os.fchmod(access_file.fileno(), 0o600)
-            print(self.token['access_token'], file=access_file)
-
-    def _file_writer(self, filename: str) -> None:
-        if not self.token or not 'access_token' in self.token:
-            raise NoTokenError("No access token available.")
-        my_token: Optional[str] = None
-        while True:
-            needs_write = False
-            with self.token_changed:
-                if my_token == self.token['access_token']:
-                    self.token_changed.wait()
-                else:
-                    my_token = self.token['access_token']
-                    needs_write = True
+            print(access_token, file=access_file)
 
-            if not my_token:
-                raise NoTokenError("Access token changed but is unavailable.")
+    def write_access_token(self, filename: str) -> None:
+        self._write_and_rename(self.get_access_token(), filename)
 
-            if needs_write:
-                self._log(f"Writing out new access token to {filename}")
-                self.write_access_token(filename)
-            if self._file_thread_exit.is_set():
+    def _file_writer(self, filename: str, tokens: 'queue.Queue[Optional[str]]') -> None:
+        while True:
+            access_token = tokens.get()
+            if access_token is None:
                 self._debug("_file_writer: Exiting")
                 break
 
+            self._log("Writing out new access token to %s", filename)
+            self._write_and_rename(access_token, filename)
+
     def start_file_writer(self, filename: str) -> None:
-        self._file_thread = threading.Thread(target=self._file_writer, args=((filename),))
+        if self._file_thread:
+            raise RuntimeError("File writer already running")
+
+        # Each refresh queues its access token; None tells the writer to exit.
+        self._file_queue = queue.Queue()
+        self._file_queue.put(self.get_access_token())
+        self._file_thread = threading.Thread(target=self._file_writer,
+                                             args=(filename, self._file_queue))
         self._file_thread.start()
 
-    def _log(self, message: str) -> None:
-        if (self.verbose or self.debug) or not sys.stderr.isatty():
-            print(message, file=sys.stderr, flush=True)
+    # Arguments are only formatted if the message is actually emitted
+    @staticmethod
+    def _log(message: str, *args: Any) -> None:
+        _LOG.info(message, *args)
 
-    def _debug(self, message: str) -> None:
-        if self.debug or not sys.stderr.isatty():
-            print(message, file=sys.stderr, flush=True)
+    @staticmethod
+    def _debug(message: str, *args: Any) -> None:
+        _LOG.debug(message, *args)
 
     def stop_file_writer(self) -> None:
         if self._file_thread:
             self._debug("Telling file thread to exit")
-            self._file_thread_exit.set()
-            with self.token_changed:
-                self.token_changed.notify()
+            if self._file_queue:
+                self._file_queue.put(None)
+                self._file_queue = None
             self._debug("Waiting for file thread to exit")
             self._file_thread.join()
+            self._file_thread = None
             self._debug("File thread has exited")
 
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[bytes, bool]:
+        """Read the request head, returning the request line and whether
+        the request carries a version (i.e. isn't HTTP/0.9)"""
+        requestline = (await reader.readline()).rstrip(b'\r\n')
+        if len(requestline.split()) != 3:
+            return requestline, False
+
+        # Skip the headers; like BaseHTTPRequestHandler, accept bare LFs
+        while (await reader.readline()).rstrip(b'\r\n'):
+            pass
+        return requestline, True
+
+    async def _handle_token_request(self, reader: asyncio.StreamReader,
+                                    writer: asyncio.StreamWriter) -> None:
+        done = asyncio.get_event_loop().create_future()
+        self._socket_clients[writer] = done
+        try:
+            try:
+                requestline, versioned = await asyncio.wait_for(self._read_request(reader),
+                                                                 self._REQUEST_TIMEOUT)
+            except (asyncio.TimeoutError, ValueError, ConnectionError):
+                return
+            if not requestline:
+                return
+
+            words = requestline.split()
+            method = words[0]
+            token = self.token
+            if len(words) not in (2, 3) or (not versioned and method != b'GET'):
+                status, body = b'400 Bad Request', b''
+            elif method not in (b'GET', b'HEAD'):
+                status, body = b'501 Not Implemented', b''
+            elif not token or not 'access_token' in token:
+                status, body = b'503 Service Unavailable', b''
+            else:
+                status, body = b'200 OK', token['access_token'].encode('utf-8')
+
+            # Only on request: the daemon logfile would otherwise get a line per poll
+            if self.verbose or self.debug:
+                self._log('"%s" %s', requestline.decode('latin-1'), status.decode())
+
+            # HTTP/0.9 responses are just the body
+            if versioned:
+                header = (b'HTTP/1.0 ' + status + b'\r\n'
+                          b'Content-Type: text/plain\r\n'
+                          b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n\r\n')
+                writer.write(header if method == b'HEAD' else header + body)
+            else:
+                writer.write(body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            del self._socket_clients[writer]
+            done.set_result(None)
+
+    async def _run_token_socket(self, sock: socket.socket, stop: asyncio.Future) -> None:
+        server = await asyncio.start_unix_server(self._handle_token_request, sock=sock)
+        try:
+            await stop
+        finally:
+            server.close()
+            # Since Python 3.12.1 wait_closed() also waits for every open
+            # connection, so hang up on clients that are still connected.
+            pending = list(self._socket_clients.values())
+            for writer in list(self._socket_clients):
+                writer.close()
+            if pending:
+                await asyncio.wait(pending)
+            await server.wait_closed()
+
+    def _serve_token_socket(self, sock: socket.socket, stop: asyncio.Future) -> None:
+        loop = cast(asyncio.AbstractEventLoop, self._socket_loop)
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._run_token_socket(sock, stop))
+        finally:
+            loop.close()
+
     def start_socket_listener(self, filename: str) -> None:
-        if self._server or self._server_thread:
+        if self._socket_thread:
             raise RuntimeError("Server already running")
 
-        self._debug(f"Starting HTTP listener on {filename}")
+        self._debug("Starting HTTP listener on %s", filename)
 
         if os.path.exists(filename):
             sock_stat = os.stat(filename)
@@ -563,11 +728,33 @@ class OAuth2ClientManager:
                 os.unlink(filename)
             else:
                 raise OSError("{filename} already exists but is not a socket.  Will not replace.")
-        self._server = _UnixSocketThreadingHTTPServer(filename, _TokenSocketHandler, self)
-        self._server.context = self
-        os.chmod(filename, 0o600)
 
-        self._start_server()
+        # Bind here so errors are reported to the caller.  Requests are
+        # served from a single event loop thread rather than a thread each.
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(filename)
+            os.chmod(filename, 0o600)
+            sock.listen()
+        except OSError:
+            sock.close()
+            raise
+
+        self._socket_loop = asyncio.new_event_loop()
+        self._socket_stop = self._socket_loop.create_future()
+        self._socket_thread = threading.Thread(target=self._serve_token_socket,
+                                               args=(sock, self._socket_stop))
+        self._socket_thread.start()
 
     def stop_socket_listener(self) -> None:
-        self._stop_server()
+        if self._socket_loop and self._socket_stop:
+            self._debug("Telling socket listener to shutdown")
+            self._socket_loop.call_soon_threadsafe(self._socket_stop.set_result, None)
+
+        if self._socket_thread:
+            self._debug("Waiting for socket listener to shutdown")
+            self._socket_thread.join()
+            self._socket_thread = None
+            self._debug("Socket listener has shutdown")
+        self._socket_loop = None
+        self._socket_stop = None